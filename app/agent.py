@@ -5,6 +5,7 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import re
 from datetime import datetime
 
 from langchain_core.messages import HumanMessage, SystemMessage
@@ -12,8 +13,7 @@ from langchain_core.messages import HumanMessage, SystemMessage
 from app.config   import get_settings
 from app.database import (
     get_conversation_history,
-    save_message,
-    upsert_session,
+    save_turn,
     create_escalation,
     similarity_search,
 )
@@ -24,76 +24,77 @@ from app.whatsapp   import send_whatsapp_message
 logger   = logging.getLogger(__name__)
 settings = get_settings()
 
+# Strong references to fire-and-forget tasks — the event loop keeps only weak
+# ones, so an unreferenced task can be garbage-collected before it finishes
+_background_tasks: set[asyncio.Task] = set()
 
-async def process_message(
-    session_id:   str,
-    phone_number: str,
-    user_message: str,
-) -> str:
-    """
-    Optimized pipeline — 1 LLM call per message.
 
-    Flow:
-    1. Load history + embed query (parallel)
-    2. Similarity search Supabase
-    3. Single LLM call → language detection + response generation
-    4. Handle escalation if needed
-    5. Save memory in background (non-blocking)
+def _discard(task: asyncio.Task | None) -> None:
     """
-
-    # ── Step 1: Parallel history load + embedding ─────────────────────
-    history_task = asyncio.create_task(
-        asyncio.to_thread(get_conversation_history, session_id, 8)
-    )
-    embed_task = asyncio.create_task(
-        asyncio.to_thread(embed_text, user_message)
-    )
-    history, embedding = await asyncio.gather(history_task, embed_task)
-
-    # ── Step 2: Vector search ──────────────────────────────────────────
-    raw_chunks = await asyncio.to_thread(
-        similarity_search, embedding, 5, 0.20
-    )
-
-    # ── Step 3: Build context ──────────────────────────────────────────
-    context = "\n\n".join(
-        f"[{i+1}] {r['content']}"
-        for i, r in enumerate(raw_chunks)
-    ) if raw_chunks else "No relevant information found in knowledge base."
-
-    # ── Step 4: Build history string ───────────────────────────────────
-    history_str = "\n".join(
-        f"{'Customer' if m['role'] == 'user' else 'ColorixBot'}: {m['content']}"
-        for m in history[-6:]
-    ) or "No previous conversation."
-
-    # ── Step 5: Get last language from history ─────────────────────────
-    last_lang = "en"
-    for msg in reversed(history):
-        if msg["role"] == "assistant":
-            last_lang = msg.get("language", "en")
-            break
-
-    # ── Step 6: Single LLM call ────────────────────────────────────────
-    system_prompt = f"""You are ColorixBot, the WhatsApp assistant for Colorix Groupe — a professional printing company in Yaoundé, Cameroon.
+    Cancel a task whose result is no longer needed. Its exception, if it
+    already failed, is retrieved so asyncio does not log it as unhandled.
+    """
+    if task is None:
+        return
+    task.cancel()
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+def _spawn(coro) -> asyncio.Task:
+    """Run `coro` in the background, holding a reference until it is done."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def _keyword_re(keywords: tuple[str, ...], whole_words: bool = False) -> re.Pattern[str]:
+    """Compile substring keywords into one alternation — a single C-level scan."""
+    pattern = "|".join(map(re.escape, keywords))
+    return re.compile(rf"\b(?:{pattern})\b" if whole_words else pattern)
+
+
+_HUMAN_RE = _keyword_re((
+    "speak to", "talk to", "real person", "human agent", "speak with",
+    "talk with", "staff", "manager", "personnel", "representative",
+    "parler à", "un agent", "responsable", "une personne",
+))
+_BOT_OFFERED_RE = _keyword_re((
+    "would you like to speak", "reply *yes*", "connect you",
+    "souhaitez-vous", "répondez *oui*",
+))
+_YES_RE = _keyword_re((
+    "yes", "oui", "yeah", "sure", "please", "ok",
+))
+_FR_RE = _keyword_re((
+    "bonjour", "salut", "merci", "oui", "non", "je", "nous",
+    "vous", "comment", "combien", "quel", "pour", "avec", "est-ce",
+    "pouvez", "avez", "voulez", "souhaitez", "livraison", "commande",
+), whole_words=True)
+
+# Prompt budget — keep only relevant chunks and the latest turns verbatim
+CONTEXT_MIN_SIMILARITY = 0.35
+CONTEXT_TOKEN_BUDGET   = 800     # ≈ 4 chars per token
+HISTORY_VERBATIM       = 4       # last 2 turns (user + assistant)
+HISTORY_SNIPPET_CHARS  = 60      # per older message in the "Earlier:" line
+
+# Invariant across requests so providers can reuse it as a cached prompt prefix.
+# Everything that changes per turn is sent in the human message instead.
+STATIC_SYSTEM_PROMPT = """You are ColorixBot, the WhatsApp assistant for Colorix Groupe — a professional printing company in Yaoundé, Cameroon.
+
+Each message gives you the KNOWLEDGE BASE, CONVERSATION HISTORY and LAST CONVERSATION LANGUAGE, followed by the CUSTOMER MESSAGE to answer.
 
 LANGUAGE RULE:
 - Detect the customer's language from their message
 - Respond in the SAME language they used
 - Default to English unless the message is clearly French
-- If message is very short (ok, yes, oui, merci), use the last conversation language which was: {last_lang}
+- If message is very short (ok, yes, oui, merci), use the LAST CONVERSATION LANGUAGE
 
 ESCALATION RULE:
 - If the customer explicitly asks to speak to a human, staff, agent, manager, or real person → respond ONLY with the word: ESCALATE
 
-KNOWLEDGE BASE:
-{context}
-
-CONVERSATION HISTORY:
-{history_str}
-
 RULES:
-1. ALWAYS try to answer the question using the knowledge base above
+1. ALWAYS try to answer the question using the knowledge base provided
 2. If the knowledge base has relevant info → use it to answer directly
 3. If the knowledge base has NO info BUT you know the answer as a printing company assistant → answer confidently using your general knowledge about Colorix's products
 4. For example: if asked about envelopes, business cards, brochures — you KNOW Colorix prints these, answer yes and give details
@@ -113,62 +114,99 @@ COMPANY INFO:
 - Products: posters, banners, flyers, business cards, brochures, envelopes, stamps, folders, signage, roll-ups, kakemono, mugs, pens, key rings, diaries, calendars, photo books, invitation cards, event packs (concert, wedding, birth, funeral)
 """
 
-    response = await invoke_with_fallback([
-        SystemMessage(content=system_prompt),
-        HumanMessage(content=user_message),
-    ])
-    response = (response or "").strip()
-
-    # ── Step 7: Check escalation ───────────────────────────────────────
-    explicit_human_keywords = [
-        "speak to", "talk to", "real person", "human agent", "speak with",
-        "talk with", "staff", "manager", "personnel", "representative",
-        "parler à", "un agent", "responsable", "une personne",
-    ]
-
-    # Check if bot offered human last turn and user said yes
-    last_bot_msg = ""
-    for msg in reversed(history):
-        if msg["role"] == "assistant":
-            last_bot_msg = msg["content"].lower()
-            break
-
-    bot_offered = any(p in last_bot_msg for p in [
-        "would you like to speak", "reply *yes*", "connect you",
-        "souhaitez-vous", "répondez *oui*",
-    ])
-    user_said_yes = any(w in user_message.lower() for w in [
-        "yes", "oui", "yeah", "sure", "please", "ok"
-    ])
-
-    needs_escalation = (
-        response.upper().startswith("ESCALATE")
-        or any(kw in user_message.lower() for kw in explicit_human_keywords)
-        or (bot_offered and user_said_yes)
+# Per-turn human message. Braces inside substituted values (e.g. KB content)
+# are not re-parsed by str.format, so they are safe.
+TURN_PROMPT_TEMPLATE = """KNOWLEDGE BASE:
+{context}
+
+CONVERSATION HISTORY:
+{history_str}
+
+LAST CONVERSATION LANGUAGE: {last_lang}
+
+CUSTOMER MESSAGE:
+{user_message}"""
+
+
+async def process_message(
+    session_id:   str,
+    phone_number: str,
+    user_message: str,
+) -> str:
+    """
+    Optimized pipeline — at most 1 LLM call per message.
+
+    Flow:
+    1. Load history ‖ (embed query → similarity search)  (parallel)
+       — the search is skipped when the user explicitly asks for a human
+    2. Keyword escalation (explicit request, or "yes" to a handoff offer)
+       → skip KB + LLM entirely
+    3. Otherwise single LLM call → language detection + response generation
+    4. Handle escalation if needed
+    5. Save memory in background (non-blocking)
+    """
+
+    msg_lc         = user_message.lower()
+    explicit_human = _HUMAN_RE.search(msg_lc) is not None
+
+    # ── Step 1: History load in parallel with embed → vector search ────
+    search_task = (
+        None if explicit_human
+        else asyncio.create_task(_embed_and_search(user_message))
     )
+    try:
+        history = await get_conversation_history(session_id, 8)
+    except BaseException:
+        _discard(search_task)
+        raise
+
+    # ── Step 2: History string, last bot message + language ────────────
+    history_str, last_lang, last_bot_msg = _scan_history(history)
+
+    # ── Step 3: Keyword escalation — no KB / LLM needed ────────────────
+    # Explicit request, or bot offered a human last turn and user said yes
+    bot_offered   = _BOT_OFFERED_RE.search(last_bot_msg) is not None
+    user_said_yes = _YES_RE.search(msg_lc) is not None
+
+    needs_escalation = explicit_human or (bot_offered and user_said_yes)
+    llm_escalated    = False
+    response         = ""
+    raw_chunks: list[dict] = []
 
-    # ── Step 8: Handle escalation ──────────────────────────────────────
     if needs_escalation:
-        escalation_id = create_escalation(
-            session_id      = session_id,
-            customer_number = phone_number,
-            trigger_reason  = "user_requested_human",
-            last_user_msg   = user_message,
-            bot_draft       = response if not response.upper().startswith("ESCALATE") else "",
+        _discard(search_task)
+    else:
+        # ── Step 4: Vector search result + context ─────────────────────
+        raw_chunks = await search_task
+        context    = _build_context(raw_chunks)
+
+        # ── Step 5: Single LLM call ────────────────────────────────────
+        # Static prompt first (cacheable prefix), per-turn data in the human turn
+        turn_prompt = TURN_PROMPT_TEMPLATE.format(
+            context      = context,
+            history_str  = history_str,
+            last_lang    = last_lang,
+            user_message = user_message,
         )
 
-        staff_number = settings.human_review_whatsapp
-        staff_msg = (
-            f"🔔 *New Customer Request #{escalation_id}*\n\n"
-            f"📱 Number: +{phone_number}\n"
-            f"💬 Message: _{user_message}_\n\n"
-            f"Please reply to them directly on WhatsApp."
-        )
-        try:
-            await send_whatsapp_message(to=staff_number, body=staff_msg)
-            logger.info(f"[escalation] #{escalation_id} — staff notified")
-        except Exception as e:
-            logger.error(f"[escalation] Staff notify failed: {e}")
+        response = await invoke_with_fallback([
+            SystemMessage(content=STATIC_SYSTEM_PROMPT),
+            HumanMessage(content=turn_prompt),
+        ], stop_prefix="ESCALATE")
+        response         = (response or "").strip()
+        llm_escalated    = response.upper().startswith("ESCALATE")
+        needs_escalation = llm_escalated
+
+    # ── Step 6: Handle escalation ──────────────────────────────────────
+    if needs_escalation:
+        # Logging + staff notification run in background — the customer
+        # reply does not wait for them
+        _spawn(_notify_staff(
+            session_id   = session_id,
+            phone_number = phone_number,
+            user_message = user_message,
+            bot_draft    = "" if llm_escalated else response,
+        ))
 
         response = (
             "I'm connecting you with a Colorix team member right now. 🙏\n\n"
@@ -180,15 +218,16 @@ COMPANY INFO:
             "Vous pouvez aussi appeler : *+237 696 26 26 56*"
         )
 
-    # ── Step 9: Detect language for storage ───────────────────────────
-    lang = "fr" if any(w in user_message.lower() for w in [
-        "bonjour", "salut", "merci", "oui", "non", "je", "nous",
-        "vous", "comment", "combien", "quel", "pour", "avec", "est-ce",
-        "pouvez", "avez", "voulez", "souhaitez", "livraison", "commande",
-    ]) else "en"
+    # ── Step 7: Detect language for storage ───────────────────────────
+    # Whole words only ("je" must not match "jet"); too-short messages keep
+    # the conversation language
+    if len(user_message.strip()) < 3:
+        lang = last_lang
+    else:
+        lang = "fr" if _FR_RE.search(msg_lc) else "en"
 
-    # ── Step 10: Save memory in background ────────────────────────────
-    asyncio.create_task(_save_memory(
+    # ── Step 8: Save memory in background ─────────────────────────────
+    _spawn(_save_memory(
         session_id   = session_id,
         phone_number = phone_number,
         user_message = user_message,
@@ -201,6 +240,98 @@ COMPANY INFO:
     return response
 
 
+def _build_context(raw_chunks: list[dict]) -> str:
+    """
+    Pack the most similar chunks into the prompt until the token budget is
+    spent. `raw_chunks` come from the RPC already filtered at
+    CONTEXT_MIN_SIMILARITY and ordered best first; the first chunk is always
+    kept even if it alone exceeds the budget.
+    """
+    parts: list[str] = []
+    budget = CONTEXT_TOKEN_BUDGET
+    for r in raw_chunks:
+        cost = len(r["content"]) // 4
+        if parts and cost > budget:
+            continue
+        parts.append(f"[{len(parts) + 1}] {r['content']}")
+        budget -= cost
+
+    return "\n\n".join(parts) or "No relevant information found in knowledge base."
+
+
+def _scan_history(history: list[dict]) -> tuple[str, str, str]:
+    """
+    Single pass over the history (oldest first). Returns:
+    - prompt string: last turns verbatim, older turns condensed into one
+      "Earlier:" line
+    - language of the last bot message ("en" if none)
+    - last bot message, lowercased ("" if none)
+    """
+    cutoff  = len(history) - HISTORY_VERBATIM
+    earlier: list[str] = []
+    recent:  list[str] = []
+    last_lang = "en"
+    last_bot  = ""
+
+    for i, m in enumerate(history):
+        content = m["content"]
+        if m["role"] == "user":
+            speaker = "Customer"
+        else:
+            speaker   = "ColorixBot"
+            last_lang = m.get("language") or "en"    # column is nullable
+            last_bot  = content
+
+        if i < cutoff:
+            snippet = content[:HISTORY_SNIPPET_CHARS].replace("\n", " ")
+            earlier.append(f"{speaker}: {snippet}")
+        else:
+            recent.append(f"{speaker}: {content}")
+
+    if earlier:
+        recent.insert(0, "Earlier: " + " / ".join(earlier))
+    history_str = "\n".join(recent) or "No previous conversation."
+    return history_str, last_lang, last_bot.lower()
+
+
+async def _embed_and_search(user_message: str) -> list[dict]:
+    """Embed the query and run the vector search as one chained task."""
+    embedding = await asyncio.to_thread(embed_text, user_message)
+    # Filter in the RPC — rows below the context cutoff would only be dropped
+    return await similarity_search(
+        embedding, 5, CONTEXT_MIN_SIMILARITY, columns="content, similarity",
+    )
+
+
+async def _notify_staff(
+    session_id:   str,
+    phone_number: str,
+    user_message: str,
+    bot_draft:    str,
+) -> None:
+    """Log the escalation and alert staff on WhatsApp."""
+    try:
+        escalation_id = await create_escalation(
+            session_id      = session_id,
+            customer_number = phone_number,
+            trigger_reason  = "user_requested_human",
+            last_user_msg   = user_message,
+            bot_draft       = bot_draft,
+        )
+
+        staff_number = settings.human_review_whatsapp
+        staff_msg = (
+            f"🔔 *New Customer Request #{escalation_id}*\n\n"
+            f"📱 Number: +{phone_number}\n"
+            f"💬 Message: _{user_message}_\n\n"
+            f"Please reply to them directly on WhatsApp."
+        )
+        await send_whatsapp_message(to=staff_number, body=staff_msg)
+        logger.info(f"[escalation] #{escalation_id} — staff notified")
+    except Exception as e:
+        logger.error(f"[escalation] Staff notify failed: {e}")
+
+
 async def _save_memory(
     session_id:   str,
     phone_number: str,
@@ -211,25 +342,15 @@ async def _save_memory(
 ) -> None:
     """Save conversation to Supabase in background — does not block response."""
     try:
-        save_message(
-            session_id = session_id,
-            role       = "user",
-            content    = user_message,
-            language   = lang,
-            metadata   = {"phone": phone_number},
-        )
-        save_message(
-            session_id = session_id,
-            role       = "assistant",
-            content    = response,
-            language   = lang,
-            metadata   = {"escalated": escalated, "timestamp": datetime.utcnow().isoformat()},
-        )
-        upsert_session(
-            session_id   = session_id,
-            phone_number = phone_number,
-            language     = lang,
-            state        = {
+        await save_turn(
+            session_id    = session_id,
+            phone_number  = phone_number,
+            user_message  = user_message,
+            bot_message   = response,
+            language      = lang,
+            user_metadata = {"phone": phone_number},
+            bot_metadata  = {"escalated": escalated, "timestamp": datetime.utcnow().isoformat()},
+            state         = {
                 "last_message":  user_message,
                 "last_response": response,
             },
@@ -1,4 +1,6 @@
 from __future__ import annotations
+import os
+from dataclasses import dataclass, field
 from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
@@ -6,69 +8,135 @@ from dotenv import load_dotenv
 # Load .env explicitly — required on Windows
 load_dotenv(dotenv_path=Path(__file__).parent.parent / ".env", override=True)
 
-from pydantic import Field
-from pydantic_settings import BaseSettings
 
+# Native output size of each provider's default model — EMBEDDING_DIM
+# overrides it (e.g. for a different HF_EMBEDDING_MODEL)
+EMBEDDING_DIMS = {
+    "google":      768,    # text-embedding-004
+    "huggingface": 384,    # paraphrase-multilingual-MiniLM-L12-v2
+}
 
-class Settings(BaseSettings):
+
+def _env(name: str, default: str | None = None) -> str:
+    value = os.environ.get(name, default)
+    if value is None:
+        raise RuntimeError(f"Missing required environment variable: {name}")
+    return value
+
+
+@dataclass(frozen=True, slots=True)
+class Settings:
 
     # Supabase
-    supabase_url:         str = Field(..., env="SUPABASE_URL")
-    supabase_service_key: str = Field(..., env="SUPABASE_SERVICE_KEY")
+    supabase_url:         str
+    supabase_service_key: str
 
     # Knowledge base
-    knowledge_base_path: str = Field(
-        "./knowledge_base/Colorix_Knowledge_Base_.txt",
-        env="KNOWLEDGE_BASE_PATH",
-    )
+    knowledge_base_path: str
 
     # LLMs
-    google_api_key: str = Field(..., env="GOOGLE_API_KEY")
-    gemini_model:   str = Field("gemini-1.5-flash",        env="GEMINI_MODEL")
-    groq_api_key:   str = Field(..., env="GROQ_API_KEY")
-    groq_model:     str = Field("llama-3.3-70b-versatile", env="GROQ_MODEL")
-    primary_llm:    str = Field("gemini",                  env="PRIMARY_LLM")
-
-    # HuggingFace
-    hf_embedding_model: str = Field(
-        "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
-        env="HF_EMBEDDING_MODEL",
-    )
-
-    twilio_account_sid:     str = Field(..., env="TWILIO_ACCOUNT_SID")
-    twilio_auth_token:      str = Field(..., env="TWILIO_AUTH_TOKEN")
-    twilio_whatsapp_number: str = Field(..., env="TWILIO_WHATSAPP_NUMBER")
+    google_api_key: str
+    gemini_model:   str
+    groq_api_key:   str
+    groq_model:     str
+    primary_llm:    str
+
+    # Embeddings
+    embedding_provider: str
+    embedding_dim:      int
+    hf_embedding_model: str
+    hf_embedding_int8:  bool
+
+    twilio_account_sid:     str
+    twilio_auth_token:      str
+    twilio_whatsapp_number: str
 
     # HITL
-    human_review_whatsapp:     str   = Field(...,  env="HUMAN_REVIEW_WHATSAPP")
-    hitl_confidence_threshold: float = Field(0.70, env="HITL_CONFIDENCE_THRESHOLD")
-    hitl_keywords: str = Field(
-        "complaint,urgent,refund,reprint,legal,manager,problem,issue",
-        env="HITL_KEYWORDS",
-    )
+    human_review_whatsapp:     str
+    hitl_confidence_threshold: float
+    hitl_keywords:             str
 
     # App
-    app_host:   str = Field("0.0.0.0", env="APP_HOST")
-    app_port:   int = Field(8000,      env="APP_PORT")
-    app_secret: str = Field("changeme",env="APP_SECRET")
-    log_level:  str = Field("INFO",    env="LOG_LEVEL")
+    app_host:   str
+    app_port:   int
+    app_secret: str
+    log_level:  str
 
     # RAG
-    vector_top_k:  int = Field(5,   env="VECTOR_TOP_K")
-    chunk_size:    int = Field(512, env="CHUNK_SIZE")
-    chunk_overlap: int = Field(64,  env="CHUNK_OVERLAP")
+    vector_top_k:  int
+    chunk_size:    int
+    chunk_overlap: int
+
+    # Parsed once from hitl_keywords in __post_init__
+    _hitl_keyword_list: tuple[str, ...] = field(init=False, repr=False, default=())
+
+    def __post_init__(self) -> None:
+        if self.embedding_provider not in EMBEDDING_DIMS:
+            raise RuntimeError(
+                f"Unknown EMBEDDING_PROVIDER: {self.embedding_provider!r} "
+                f"(expected one of {', '.join(EMBEDDING_DIMS)})"
+            )
+        object.__setattr__(
+            self,
+            "_hitl_keyword_list",
+            tuple(k.strip().lower() for k in self.hitl_keywords.split(",")),
+        )
 
     @property
-    def hitl_keyword_list(self) -> list[str]:
-        return [k.strip().lower() for k in self.hitl_keywords.split(",")]
-
-    model_config = {
-        "env_file":          ".env",
-        "env_file_encoding": "utf-8",
-        "extra":             "ignore",
-    }
+    def hitl_keyword_list(self) -> tuple[str, ...]:
+        return self._hitl_keyword_list
+
+    @classmethod
+    def from_env(cls) -> Settings:
+        embedding_provider = _env("EMBEDDING_PROVIDER", "google").lower()
+        return cls(
+            supabase_url         = _env("SUPABASE_URL"),
+            supabase_service_key = _env("SUPABASE_SERVICE_KEY"),
+
+            knowledge_base_path = _env(
+                "KNOWLEDGE_BASE_PATH",
+                "./knowledge_base/Colorix_Knowledge_Base_.txt",
+            ),
+
+            google_api_key = _env("GOOGLE_API_KEY"),
+            gemini_model   = _env("GEMINI_MODEL", "gemini-1.5-flash"),
+            groq_api_key   = _env("GROQ_API_KEY"),
+            groq_model     = _env("GROQ_MODEL",   "llama-3.3-70b-versatile"),
+            primary_llm    = _env("PRIMARY_LLM",  "gemini"),
+
+            embedding_provider = embedding_provider,
+            embedding_dim      = int(_env(
+                "EMBEDDING_DIM",
+                str(EMBEDDING_DIMS.get(embedding_provider, 0)),
+            )),
+            hf_embedding_model = _env(
+                "HF_EMBEDDING_MODEL",
+                "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
+            ),
+            hf_embedding_int8  = _env("HF_EMBEDDING_INT8", "false").lower() in ("1", "true", "yes"),
+
+            twilio_account_sid     = _env("TWILIO_ACCOUNT_SID"),
+            twilio_auth_token      = _env("TWILIO_AUTH_TOKEN"),
+            twilio_whatsapp_number = _env("TWILIO_WHATSAPP_NUMBER"),
+
+            human_review_whatsapp     = _env("HUMAN_REVIEW_WHATSAPP"),
+            hitl_confidence_threshold = float(_env("HITL_CONFIDENCE_THRESHOLD", "0.70")),
+            hitl_keywords             = _env(
+                "HITL_KEYWORDS",
+                "complaint,urgent,refund,reprint,legal,manager,problem,issue",
+            ),
+
+            app_host   = _env("APP_HOST",   "0.0.0.0"),
+            app_port   = int(_env("APP_PORT", "8000")),
+            app_secret = _env("APP_SECRET", "changeme"),
+            log_level  = _env("LOG_LEVEL",  "INFO"),
+
+            vector_top_k  = int(_env("VECTOR_TOP_K",  "5")),
+            chunk_size    = int(_env("CHUNK_SIZE",    "512")),
+            chunk_overlap = int(_env("CHUNK_OVERLAP", "64")),
+        )
 
 
 @lru_cache
 def get_settings() -> Settings:
-    return Settings()
+    return Settings.from_env()
@@ -1,13 +1,22 @@
 from __future__ import annotations
+import asyncio
 import logging
 from datetime import datetime
-from supabase import create_client, Client
+from supabase import create_client, acreate_client, Client, AsyncClient
 from app.config import get_settings
+from app.sim_cache import SimilarityCache
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
 _supabase: Client | None = None
+_async_supabase: AsyncClient | None = None
+_async_supabase_lock = asyncio.Lock()
+
+# Near-duplicate queries (cosine distance < 0.05) reuse the previous result.
+# The TTL bounds staleness after a re-ingest run from another process
+# (python -m scripts.ingest); /admin/ingest clears it explicitly.
+_search_cache = SimilarityCache(maxsize=512, max_distance=0.05, ttl=600)
 
 def get_supabase() -> Client:
     global _supabase
@@ -19,6 +28,21 @@ def get_supabase() -> Client:
     return _supabase
 
 
+async def get_async_supabase() -> AsyncClient:
+    """Async client for the per-message hot path — IO yields on the event loop."""
+    global _async_supabase
+    if _async_supabase is None:
+        # acreate_client awaits — without the lock, concurrent first callers
+        # (lifespan warm-up + first webhook) would each build a client
+        async with _async_supabase_lock:
+            if _async_supabase is None:
+                _async_supabase = await acreate_client(
+                    settings.supabase_url,
+                    settings.supabase_service_key
+                )
+    return _async_supabase
+
+
 def insert_document_chunks(rows: list[dict]) -> None:
     """
     Bulk insert document chunks into colorix_documents.
@@ -29,23 +53,35 @@ def insert_document_chunks(rows: list[dict]) -> None:
     db.table("colorix_documents").insert(rows).execute()
 
 
-def similarity_search(query_embedding: list[float],
-                      top_k: int = 5,
-                      threshold: float = 0.40) -> list[dict]:
+async def similarity_search(query_embedding: list[float],
+                            top_k: int = 5,
+                            threshold: float = 0.40,
+                            columns: str = "id, content, metadata, similarity",
+                            ) -> list[dict]:
     """
     Call the match_colorix_documents Postgres function.
-    Return list of {id, content, metadata, similarity}.
+    Return list of dicts with the requested `columns`
+    (default {id, content, metadata, similarity}).
+    Results are served from the similarity cache for near-duplicate queries.
     """
 
-    db = get_supabase()
+    params = (top_k, threshold, columns)
+    cached = _search_cache.get(query_embedding, params)
+    if cached is not None:
+        return cached
+
+    db = await get_async_supabase()
     try:
-        result = db.rpc("match_colorix_documents",
+        result = await db.rpc("match_colorix_documents",
         {
             "query_embedding": query_embedding,
             "match_threshold": threshold,
             "match_count": top_k
-        },).execute()
-        return result.data or []
+        },).select(columns).execute()
+        rows = result.data or []
+        if rows:    # an empty result may just be a re-ingest in progress
+            _search_cache.put(query_embedding, rows, params)
+        return rows
     except Exception as e:
         logger.error(f"Similarity search failed: {e}")
         return []
@@ -56,6 +92,14 @@ def clear_documents() -> None:
     db.table("colorix_documents").delete().neq("id", 0).execute()
 
 
+def clear_search_cache() -> None:
+    """
+    Drop cached search results. Call from the event loop once re-ingestion
+    has finished inserting — not from the ingest thread.
+    """
+    _search_cache.clear()
+
+
 def document_count() -> int:
     """Return the number of chunks currently stored."""
     db = get_supabase()
@@ -64,33 +108,17 @@ def document_count() -> int:
 
 
 # Conversation Memory
-def save_message(session_id: str,
-                 role: str,
-                 content: str,
-                 language: str = "en",
-                 metadata: dict | None = None
-                 ) -> None:
-    db = get_supabase()
-    db.table("colorix_conversations").insert({
-        "session_id": session_id,
-        "role": role,
-        "content": content,
-        "language": language,
-        "metadata": metadata or {},
-    }).execute()
-
-
-def get_conversation_history(session_id: str, limit: int = 12) -> list[dict]:
-    """Return last N messages for a session, oldesr-first"""
-    db = get_supabase()
-    result = (db.table("colorix_conversations")
-              .select("role, content, created_at")
+async def get_conversation_history(session_id: str, limit: int = 12) -> list[dict]:
+    """Return last N messages for a session, oldest-first"""
+    db = await get_async_supabase()
+    result = await (db.table("colorix_conversations")
+              .select("role, content, language")
               .eq("session_id", session_id)
-              .order("created_at", desc=False)
+              .order("created_at", desc=True)
               .limit(limit)
               .execute()
               )
-    return result.data or []
+    return (result.data or [])[::-1]
 
 
 # Session State
@@ -107,25 +135,36 @@ def get_session(session_id: str) -> dict | None:
 
     return result.data
 
-def upsert_session(
-    session_id:   str,
-    phone_number: str,
-    language:     str,
-    state:        dict,
+async def save_turn(
+    session_id:    str,
+    phone_number:  str,
+    user_message:  str,
+    bot_message:   str,
+    language:      str,
+    user_metadata: dict,
+    bot_metadata:  dict,
+    state:         dict,
 ) -> None:
-    db = get_supabase()
-    db.table("colorix_sessions").upsert({
-        "session_id":   session_id,
-        "phone_number": phone_number,
-        "language":     language,
-        "state":        state,
-        "last_active":  datetime.utcnow().isoformat(),
+    """
+    Save both messages of a turn and upsert the session in one RPC
+    (save_turn Postgres function — see supabase/migrations).
+    """
+    db = await get_async_supabase()
+    await db.rpc("save_turn", {
+        "p_session_id":    session_id,
+        "p_phone_number":  phone_number,
+        "p_user_message":  user_message,
+        "p_bot_message":   bot_message,
+        "p_language":      language,
+        "p_user_metadata": user_metadata,
+        "p_bot_metadata":  bot_metadata,
+        "p_state":         state,
     }).execute()
 
     
 # Escalation logging
 
-def create_escalation(
+async def create_escalation(
         session_id: str,
         customer_number: str,
         trigger_reason: str,
@@ -133,8 +172,8 @@ def create_escalation(
         bot_draft: str | None = None
  ) -> int:
     
-    db = get_supabase()
-    result = (
+    db = await get_async_supabase()
+    result = await (
         db.table("colorix_escalations").insert({
             "session_id": session_id,
             "customer_number": customer_number,
@@ -1,30 +1,211 @@
 """
-embeddings.py — Lightweight embeddings via Google GenAI SDK
+embeddings.py — Query and document embeddings, one provider per deployment
+
+EMBEDDING_PROVIDER selects the backend:
+  google       Gemini text-embedding-004 over HTTP (768-dim, default)
+  huggingface  local sentence-transformers HF_EMBEDDING_MODEL
+               (optional dependency: pip install langchain-huggingface)
+               HF_EMBEDDING_INT8=true runs it with int8 dynamic quantization
+
+EMBEDDING_DIM defaults to the provider's native size (app.config.EMBEDDING_DIMS)
+and must match the colorix_documents.embedding halfvec(N) column — the
+migrations create 768 for the default google provider.
+All vectors are returned L2-normalized, so match_colorix_documents can rank by
+inner product (see supabase/migrations).
 """
 from __future__ import annotations
 
 import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import count
+
+import numpy as np
+
 from app.config import get_settings
 
 logger   = logging.getLogger(__name__)
 settings = get_settings()
 
+_calls = count(1)
 
-def embed_text(text: str) -> list[float]:
-    """Embed a single string using Google Gemini embedding."""
+# Gemini's batch embedding endpoint accepts at most 100 inputs per request
+MAX_BATCH = 100
+
+
+class _QueryCache:
+    """
+    Thread-safe LRU with a per-entry TTL for query embeddings — embed_text
+    runs in worker threads via asyncio.to_thread.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl     = ttl
+        self.hits    = 0
+        self.misses  = 0
+        self._data: OrderedDict[str, tuple[float, tuple[float, ...]]] = OrderedDict()
+        self._lock  = threading.Lock()
+
+    def get(self, key: str) -> tuple[float, ...] | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, value: tuple[float, ...]) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __repr__(self) -> str:
+        return f"hits={self.hits} misses={self.misses} size={len(self._data)}/{self.maxsize}"
+
+
+_query_cache = _QueryCache(maxsize=2048, ttl=3600)
+
+
+def _cache_key(text: str) -> str:
+    return text.strip().lower()
+
+
+@lru_cache(maxsize=1)
+def _get_genai():
+    import google.generativeai as genai
+    genai.configure(api_key=settings.google_api_key)
+    return genai
+
+
+@lru_cache(maxsize=1)
+def get_hf_embeddings():
+    """Load the local HuggingFace model once per process."""
+    # Pin torch/BLAS threads before torch is imported: concurrent embed calls
+    # from asyncio.to_thread would otherwise each fan out to every core
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ.setdefault(var, "1")
+    import torch
+    torch.set_num_threads(int(os.environ["OMP_NUM_THREADS"]))
     try:
-        import google.generativeai as genai
-        genai.configure(api_key=settings.google_api_key)
-        result = genai.embed_content(
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass    # can only be set once, before any parallel work
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+    embeddings = HuggingFaceEmbeddings(
+        model_name    = settings.hf_embedding_model,
+        encode_kwargs = {"normalize_embeddings": True, "batch_size": 64},
+    )
+
+    if settings.hf_embedding_int8:
+        # int8 weights for every Linear layer (fbgemm int8 GEMM, VNNI where
+        # available) — ~2× CPU encode throughput. Vectors shift slightly, so
+        # re-ingest after toggling.
+        model = getattr(embeddings, "_client", None) or embeddings.client
+        torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True,
+        )
+        logger.info(f"[embeddings] {settings.hf_embedding_model} quantized to int8")
+    return embeddings
+
+
+def _normalize(vectors: list[list[float]]) -> list[list[float]]:
+    """L2-normalize row-wise (zero rows are left as-is)."""
+    arr   = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(arr, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (arr / norms).tolist()
+
+
+def _embed_batch(texts: list[str]) -> list[list[float]]:
+    """
+    Raw provider call for up to MAX_BATCH texts — raises on failure or when
+    the provider's dimension does not match EMBEDDING_DIM.
+    Returns unit-norm vectors.
+    """
+    provider = settings.embedding_provider
+    if provider == "google":
+        result = _get_genai().embed_content(
             model   = "models/text-embedding-004",
-            content = text,
+            content = texts,
+        )
+        vectors = result["embedding"]
+    elif provider == "huggingface":
+        vectors = get_hf_embeddings().embed_documents(texts)
+    else:
+        raise ValueError(f"Unknown EMBEDDING_PROVIDER: {provider!r}")
+
+    if vectors and len(vectors[0]) != settings.embedding_dim:
+        raise ValueError(
+            f"{provider} returned {len(vectors[0])}-dim embeddings, "
+            f"expected EMBEDDING_DIM={settings.embedding_dim}"
         )
-        return result["embedding"]
-    except Exception as e:
-        logger.error(f"Embedding failed: {e}")
-        return [0.0] * 768
+    return _normalize(vectors)
+
+
+def embed_text(text: str) -> list[float]:
+    """
+    Embed a single query string. Cached for an hour by normalized text;
+    failures are never cached.
+    """
+    return embed_queries([text])[0]
+
+
+def embed_queries(texts: list[str]) -> list[list[float]]:
+    """
+    Embed several query strings through the query cache. All cache misses
+    are embedded together in one provider call.
+    """
+    keys    = [_cache_key(t) for t in texts]
+    vectors: dict[str, tuple[float, ...]] = {}
+    for key in keys:
+        cached = _query_cache.get(key)
+        if cached is not None:
+            vectors[key] = cached
+
+    missing = [k for k in dict.fromkeys(keys) if k not in vectors]
+    for i in range(0, len(missing), MAX_BATCH):
+        batch = missing[i : i + MAX_BATCH]
+        try:
+            fresh = _embed_batch(batch)
+        except Exception as e:
+            logger.error(f"Embedding failed: {e}")
+            continue
+        for key, vec in zip(batch, fresh):
+            vectors[key] = tuple(vec)
+            _query_cache.put(key, vectors[key])
+
+    if next(_calls) % 1000 == 0:
+        logger.info(f"[embeddings] cache {_query_cache!r}")
+
+    zero = [0.0] * settings.embedding_dim
+    return [list(vectors[k]) if k in vectors else zero for k in keys]
 
 
 def embed_texts(texts: list[str]) -> list[list[float]]:
-    """Batch embed multiple strings."""
-    return [embed_text(t) for t in texts]
+    """
+    Batch embed multiple strings (uncached — used for ingestion).
+    One provider call per MAX_BATCH inputs instead of one per string.
+    Raises RuntimeError if any batch fails — storing zero vectors would
+    silently drop those chunks from search.
+    """
+    embeddings: list[list[float]] = []
+    for i in range(0, len(texts), MAX_BATCH):
+        batch = texts[i : i + MAX_BATCH]
+        try:
+            embeddings.extend(_embed_batch(batch))
+        except Exception as e:
+            raise RuntimeError(
+                f"Batch embedding failed (texts {i}–{i + len(batch) - 1}): {e}"
+            ) from e
+    return embeddings
@@ -28,20 +28,45 @@ def get_groq() -> ChatGroq:
     )
 
 
-async def invoke_with_fallback(messages: list, prefer: str | None=None) -> str:
+async def _generate(llm, messages: list, stop_prefix: str | None) -> str:
+    """
+    Stream the completion. With `stop_prefix`, stop reading as soon as the
+    reply is known to start with it — the rest would be thrown away anyway.
+    """
+    buf    = ""
+    watch  = stop_prefix is not None
+    stream = llm.astream(messages)
+    try:
+        async for chunk in stream:
+            buf += chunk.content
+            if watch:
+                head = buf.lstrip().upper()
+                if head.startswith(stop_prefix):
+                    return stop_prefix
+                if len(head) >= len(stop_prefix):
+                    watch = False
+    finally:
+        # Close now, not at GC — cancels the upstream HTTP stream on early exit
+        await stream.aclose()
+    return buf
+
+
+async def invoke_with_fallback(
+    messages:    list,
+    prefer:      str | None = None,
+    stop_prefix: str | None = None,
+) -> str:
     """
     Try primary LLm. On any failure, automatically switch to the other.
-    Return plain text response.
+    Return plain text response — just `stop_prefix` if the reply starts with it.
     """
 
     use_groq = (prefer or settings.primary_llm) == "groq"
     primary = get_groq() if use_groq else get_gemini()
-    fallback = get_gemini if use_groq else get_groq()
+    fallback = get_gemini() if use_groq else get_groq()
 
     try:
-        resp = await primary.ainvoke(messages)
-        return resp.content
+        return await _generate(primary, messages, stop_prefix)
     except Exception as e:
         logger.warning(f"Primary LLM failed ({e}) - switching to fallback")
-        resp = await fallback.ainvoke(messages)
-        return resp.content
\ No newline at end of file
+        return await _generate(fallback, messages, stop_prefix)
@@ -3,8 +3,10 @@ main.py — FastAPI with Twilio WhatsApp webhook
 """
 from __future__ import annotations
 
+import asyncio
 import logging
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 
 from fastapi           import FastAPI, Request, BackgroundTasks
@@ -29,14 +31,49 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+GREETINGS = frozenset({
+    "hi", "hello", "bonjour", "salut", "hey",
+    "start", "menu", "help", "aide",
+})
+
+MEDIA_REPLIES = {
+    "en": (
+        "Thank you for the file! 📎\n\n"
+        "To submit design files please upload at colorixgroupe.com "
+        "or call: *+237 696 26 26 56* 😊"
+    ),
+    "fr": (
+        "Merci pour le fichier ! 📎\n\n"
+        "Pour soumettre des fichiers, déposez-les sur "
+        "colorixgroupe.com ou appelez : *+237 696 26 26 56* 😊"
+    ),
+}
+_FALLBACK_MEDIA = "Please visit colorixgroupe.com to upload your file."
+
+# Ingestion runs for minutes — keep it off the default executor that serves
+# asyncio.to_thread (embeddings, LLM warmup). One worker also serializes
+# overlapping /admin/ingest calls.
+_ingest_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-job")
+
+# Greetings are a fixed set, so their language and reply are resolved once
+GREETING_REPLIES = {g: get_greeting(detect_language(g)) for g in GREETINGS}
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("🚀 Colorix WhatsApp Agent starting...")
 
+    # Warm everything the first message would otherwise pay for
     from app.embeddings import embed_text
-    embed_text("warmup")
-    logger.info("✅ Embedding model ready")
+    from app.llm        import get_gemini, get_groq
+    from app.database   import get_async_supabase
+    await asyncio.gather(
+        asyncio.to_thread(embed_text, "warmup"),
+        asyncio.to_thread(get_gemini),
+        asyncio.to_thread(get_groq),
+        get_async_supabase(),
+    )
+    logger.info("✅ Embedding model, LLM clients and Supabase ready")
 
     from app.database import document_count
     count = document_count()
@@ -48,6 +85,10 @@ async def lifespan(app: FastAPI):
     yield
     logger.info("🛑 Shutting down")
 
+    from app.whatsapp import get_twilio_http
+    await get_twilio_http().aclose()
+    _ingest_executor.shutdown(wait=False, cancel_futures=True)
+
 
 app = FastAPI(
     title    = "Colorix Groupe — WhatsApp RAG Agent",
@@ -68,8 +109,7 @@ async def whatsapp_webhook(request: Request, background_tasks: BackgroundTasks):
     Twilio sends form-encoded POST requests.
     Always return 200 immediately — process in background.
     """
-    form_data = dict(await request.form())
-    msg = parse_twilio_webhook(form_data)
+    msg = parse_twilio_webhook(await request.form())
 
     if not msg:
         return Response(content="", media_type="text/xml")
@@ -84,32 +124,17 @@ async def whatsapp_webhook(request: Request, background_tasks: BackgroundTasks):
 
     # Media messages
     if num_media > 0:
-        lang  = detect_language(text or "hello")
-        reply = {
-            "en": (
-                "Thank you for the file! 📎\n\n"
-                "To submit design files please upload at colorixgroupe.com "
-                "or call: *+237 696 26 26 56* 😊"
-            ),
-            "fr": (
-                "Merci pour le fichier ! 📎\n\n"
-                "Pour soumettre des fichiers, déposez-les sur "
-                "colorixgroupe.com ou appelez : *+237 696 26 26 56* 😊"
-            ),
-        }.get(lang, "Please visit colorixgroupe.com to upload your file.")
+        lang  = detect_language(text) if text else "en"
+        reply = MEDIA_REPLIES.get(lang, _FALLBACK_MEDIA)
         background_tasks.add_task(send_whatsapp_message, to=from_raw, body=reply)
         return Response(content="", media_type="text/xml")
 
     # Greetings
-    if not text or text.lower() in {
-        "hi", "hello", "bonjour", "salut", "hey",
-        "start", "menu", "help", "aide"
-    }:
-        lang = detect_language(text or "hello")
+    if not text or text.lower() in GREETINGS:
         background_tasks.add_task(
             send_whatsapp_message,
             to   = from_raw,
-            body = get_greeting(lang),
+            body = GREETING_REPLIES[text.lower()] if text else get_greeting("en"),
         )
         return Response(content="", media_type="text/xml")
 
@@ -179,11 +204,19 @@ async def admin_ingest(background_tasks: BackgroundTasks, secret: str):
 
 
 async def _run_ingestion():
-    import asyncio
     from pathlib import Path
     from scripts.ingest import run_ingestion
-    loop = asyncio.get_event_loop()
-    await loop.run_in_executor(None, run_ingestion, Path(settings.knowledge_base_path))
+    from app.database   import clear_search_cache
+    from app.retriever  import clear_semantic_cache
+    try:
+        await asyncio.get_running_loop().run_in_executor(
+            _ingest_executor, run_ingestion, Path(settings.knowledge_base_path),
+        )
+    finally:
+        # Back on the event loop, after every insert has landed — results
+        # cached mid-ingest may be partial
+        clear_search_cache()
+        clear_semantic_cache()
 
 
 @app.get("/admin/stats")
@@ -4,43 +4,81 @@ Uses the LLM to rephrase queries before embedding for better semantic matching.
 """
 from __future__ import annotations
 
+import asyncio
+import heapq
 import logging
-from dataclasses import dataclass
+from itertools import chain
+from typing import NamedTuple
 
-from app.embeddings import embed_text
+from app.embeddings import embed_text, embed_queries
 from app.database   import similarity_search
 from app.config     import get_settings
+from app.sim_cache  import SimilarityCache
 
 logger   = logging.getLogger(__name__)
 settings = get_settings()
 
+# Paraphrased questions (cosine ≥ 0.95 on the raw query) reuse the previous
+# retrieval — skipping both the HyDE LLM call and the vector searches.
+# Same TTL / invalidation as the search cache in app.database.
+_semantic_cache = SimilarityCache(maxsize=2048, max_distance=0.05, ttl=600)
 
-@dataclass
-class RetrievedChunk:
+
+def clear_semantic_cache() -> None:
+    """Drop cached retrievals (event loop only — see clear_search_cache)."""
+    _semantic_cache.clear()
+
+# Queries made only of these tokens are already good search keys — HyDE
+# rephrasing adds a full LLM round-trip for nothing
+HYDE_MIN_WORDS = 4
+HYDE_MIN_CHARS = 20
+_KEYWORD_TOKENS = frozenset({
+    "price", "prices", "prix", "tarif", "tarifs", "cost", "quote", "devis",
+    "contact", "phone", "téléphone", "address", "adresse", "location",
+    "hours", "horaires", "delivery", "livraison", "payment", "paiement",
+    "flyer", "flyers", "poster", "posters", "affiche", "affiches",
+    "banner", "banners", "brochure", "brochures", "envelope", "envelopes",
+    "enveloppe", "enveloppes", "stamp", "stamps", "cachet", "cachets",
+    "business", "card", "cards", "carte", "cartes", "visite",
+    "mug", "mugs", "calendar", "calendars", "calendrier", "kakemono",
+    "roll-up", "signage", "website", "site",
+})
+
+
+def _is_keyword_query(query: str) -> bool:
+    words = query.lower().replace("?", " ").split()
+    return bool(words) and all(w in _KEYWORD_TOKENS for w in words)
+
+
+class RetrievedChunk(NamedTuple):
     content:    str
     metadata:   dict
     similarity: float
 
 
+# The customer question is sent only as the HumanMessage
+EXPANSION_PROMPT = (
+    "You are a search query optimizer for a printing company knowledge base.\n"
+    "Rephrase the customer question into a clear, keyword-rich search query.\n"
+    "Include relevant synonyms and related terms.\n"
+    "Return ONLY the rephrased query, nothing else."
+)
+
+
 async def expand_query(query: str) -> str:
     """
     Use LLM to rephrase query into a more retrieval-friendly form.
     This dramatically improves semantic search recall.
     """
+    if len(query) < HYDE_MIN_CHARS:
+        return query
+
     from app.llm import invoke_with_fallback
     from langchain_core.messages import SystemMessage, HumanMessage
 
-    prompt = (
-        "You are a search query optimizer for a printing company knowledge base.\n"
-        "Rephrase the following customer question into a clear, keyword-rich search query.\n"
-        "Include relevant synonyms and related terms.\n"
-        "Return ONLY the rephrased query, nothing else.\n\n"
-        f"Customer question: {query}"
-    )
-
     try:
         rephrased = await invoke_with_fallback([
-            SystemMessage(content=prompt),
+            SystemMessage(content=EXPANSION_PROMPT),
             HumanMessage(content=query),
         ])
         rephrased = rephrased.strip()
@@ -56,48 +94,72 @@ async def expand_query(query: str) -> str:
 async def retrieve(query: str, top_k: int | None = None) -> list[RetrievedChunk]:
     """
     RAG retrieval with LLM-based query expansion.
-    1. Expand query using LLM
-    2. Embed both original and expanded query
+    1. Expand query using LLM ‖ embed original query (parallel)
+       — a semantic cache hit on the original cancels the expansion
+       — short / keyword-only queries skip the expansion
+    2. Embed queries in one batch (cached), search both
     3. Merge results, deduplicate, return top k
     """
     k = top_k or settings.vector_top_k
 
-    # Get LLM-expanded query
-    expanded = await expand_query(query)
+    need_hyde = (
+        len(query) >= HYDE_MIN_CHARS
+        and len(query.split()) >= HYDE_MIN_WORDS
+        and not _is_keyword_query(query)
+    )
+    if not need_hyde:
+        logger.debug(f"[query expansion] skipped for {query[:50]!r}")
+
+    # Get LLM-expanded query while the original is embedded
+    expand_task     = asyncio.create_task(expand_query(query)) if need_hyde else None
+    query_embedding = await asyncio.to_thread(embed_text, query)
+
+    cached = _semantic_cache.get(query_embedding, k)
+    if cached is not None:
+        if expand_task is not None:
+            expand_task.cancel()
+        logger.info(f"[semantic cache] hit for {query[:50]!r}")
+        return list(cached)
+
+    expanded = await expand_task if expand_task is not None else query
 
     # Deduplicate queries
     queries = list(dict.fromkeys([query, expanded]))
 
-    all_results: dict[int, dict] = {}
-    for q in queries:
-        embedding = embed_text(q)
-        results   = similarity_search(
+    # One batched embedding call — the original query is a cache hit
+    embeddings = await asyncio.to_thread(embed_queries, queries)
+
+    # Searches run concurrently on the async Supabase client
+    results_per_query = await asyncio.gather(*(
+        similarity_search(
             query_embedding = embedding,
             top_k           = k,
             threshold       = 0.15,
         )
-        for r in results:
-            chunk_id = r["id"]
-            if chunk_id not in all_results or r["similarity"] > all_results[chunk_id]["similarity"]:
-                all_results[chunk_id] = r
+        for embedding in embeddings
+    ))
+
+    all_results: dict[int, dict] = {}
+    for r in chain.from_iterable(results_per_query):
+        chunk_id = r["id"]
+        if chunk_id not in all_results or r["similarity"] > all_results[chunk_id]["similarity"]:
+            all_results[chunk_id] = r
 
-    sorted_results = sorted(
-        all_results.values(),
-        key     = lambda x: x["similarity"],
-        reverse = True,
-    )[:k]
+    # O(n log k) top-k instead of sorting every merged result
+    sorted_results = heapq.nlargest(k, all_results.values(), key=lambda x: x["similarity"])
 
     chunks = [
         RetrievedChunk(
             content    = r["content"],
             metadata   = r.get("metadata", {}),
-            similarity = round(float(r.get("similarity", 0.0)), 4),
+            similarity = float(r.get("similarity", 0.0)),
         )
         for r in sorted_results
     ]
 
     if chunks:
         logger.info(f"Retrieved {len(chunks)} chunks | best={chunks[0].similarity:.3f}")
+        _semantic_cache.put(query_embedding, chunks, k)
     else:
         logger.warning(f"No chunks found for: {query[:50]!r}")
 
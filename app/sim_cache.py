@@ -0,0 +1,107 @@
+"""
+sim_cache.py — LRU cache keyed by embedding similarity
+A lookup hits when a cached key is within `max_distance` cosine distance of the query.
+"""
+from __future__ import annotations
+
+import time
+from collections.abc import Hashable
+from typing import Any
+
+import numpy as np
+
+
+class SimilarityCache:
+    """
+    Keys are stored L2-normalized in one float32 matrix, so a lookup is a
+    single BLAS matrix-vector product over all entries. Entries are only
+    compared against entries stored with the same `params` (e.g. top_k and
+    threshold of the search that produced them). Entries expire `ttl`
+    seconds after insertion (None = never).
+    Not thread-safe — use from the event loop only.
+    """
+
+    def __init__(
+        self,
+        maxsize:      int          = 512,
+        max_distance: float        = 0.05,
+        ttl:          float | None = None,
+    ) -> None:
+        self.maxsize      = maxsize
+        self.max_distance = max_distance
+        self.ttl          = ttl
+        self.hits   = 0
+        self.misses = 0
+        self.clear()
+
+    def clear(self) -> None:
+        self._keys:      np.ndarray | None = None
+        self._values:    list[Any]         = []
+        self._param_ids  = np.zeros(self.maxsize, dtype=np.int32)
+        self._ticks      = np.zeros(self.maxsize, dtype=np.int64)
+        self._expires    = np.zeros(self.maxsize, dtype=np.float64)
+        self._params:    dict[Hashable, int] = {}
+        self._clock      = 0
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    @staticmethod
+    def _normalize(embedding: list[float]) -> np.ndarray | None:
+        vec  = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm else None
+
+    def get(self, embedding: list[float], params: Hashable = ()) -> Any | None:
+        """Return the value of the closest cached key, or None on a miss."""
+        n   = len(self._values)
+        pid = self._params.get(params)
+        vec = self._normalize(embedding)
+        if not n or pid is None or vec is None or vec.shape[0] != self._keys.shape[1]:
+            self.misses += 1
+            return None
+
+        sims = self._keys[:n] @ vec
+        sims[self._param_ids[:n] != pid] = -np.inf
+        sims[self._expires[:n] < time.monotonic()] = -np.inf
+        best = int(np.argmax(sims))
+        if 1.0 - sims[best] > self.max_distance:
+            self.misses += 1
+            return None
+
+        self._clock += 1
+        self._ticks[best] = self._clock
+        self.hits += 1
+        return self._values[best]
+
+    def put(self, embedding: list[float], value: Any, params: Hashable = ()) -> None:
+        """
+        Insert a value, reusing an expired slot or evicting the least
+        recently used entry when full.
+        """
+        vec = self._normalize(embedding)
+        if vec is None:          # zero vector = failed embedding, never cache
+            return
+        if self._keys is None:
+            self._keys = np.zeros((self.maxsize, vec.shape[0]), dtype=np.float32)
+        elif vec.shape[0] != self._keys.shape[1]:
+            return
+
+        pid = self._params.setdefault(params, len(self._params))
+        n   = len(self._values)
+        if n < self.maxsize:
+            slot = n
+            self._values.append(value)
+        else:
+            now     = time.monotonic()
+            expired = np.flatnonzero(self._expires < now)
+            slot    = int(expired[0]) if expired.size else int(np.argmin(self._ticks))
+            self._values[slot] = value
+
+        self._clock += 1
+        self._keys[slot]      = vec
+        self._param_ids[slot] = pid
+        self._ticks[slot]     = self._clock
+        self._expires[slot]   = (
+            np.inf if self.ttl is None else time.monotonic() + self.ttl
+        )
@@ -4,7 +4,9 @@ whatsapp.py — Twilio WhatsApp Sandbox
 from __future__ import annotations
 
 import logging
-from twilio.rest import Client
+from collections.abc import Mapping
+from functools import lru_cache
+import httpx
 from twilio.request_validator import RequestValidator
 from app.config import get_settings
 
@@ -12,14 +14,21 @@ logger   = logging.getLogger(__name__)
 settings = get_settings()
 
 
-def get_twilio_client() -> Client:
-    return Client(settings.twilio_account_sid, settings.twilio_auth_token)
+@lru_cache(maxsize=1)
+def get_twilio_http() -> httpx.AsyncClient:
+    """Shared async client for the Twilio REST API — keep-alive across sends."""
+    return httpx.AsyncClient(
+        base_url = "https://api.twilio.com",
+        auth     = (settings.twilio_account_sid, settings.twilio_auth_token),
+        timeout  = 10,
+    )
 
 
 async def send_whatsapp_message(to: str, body: str) -> None:
-    """Send a WhatsApp message via Twilio. `to` must include whatsapp: prefix."""
-    client = get_twilio_client()
-
+    """
+    Send a WhatsApp message via Twilio. `to` must include whatsapp: prefix.
+    Posts to the Messages API directly so the event loop is never blocked.
+    """
     # Ensure proper format
     if not to.startswith("whatsapp:"):
         to = f"whatsapp:{to}"
@@ -27,12 +36,16 @@ async def send_whatsapp_message(to: str, body: str) -> None:
     if not from_number.startswith("whatsapp:"):
         from_number = f"whatsapp:{from_number}"
 
-    msg = client.messages.create(
-        body = body[:1600],
-        from_ = from_number,
-        to = to,
+    resp = await get_twilio_http().post(
+        f"/2010-04-01/Accounts/{settings.twilio_account_sid}/Messages.json",
+        data = {
+            "Body": body[:1600],
+            "From": from_number,
+            "To":   to,
+        },
     )
-    logger.info(f"Sent to {to} | sid={msg.sid}")
+    resp.raise_for_status()
+    logger.info(f"Sent to {to} | sid={resp.json().get('sid')}")
 
 
 def validate_twilio_request(
@@ -45,9 +58,9 @@ def validate_twilio_request(
     return validator.validate(url, params, signature)
 
 
-def parse_twilio_webhook(form_data: dict) -> dict | None:
+def parse_twilio_webhook(form_data: Mapping[str, str]) -> dict | None:
     """
-    Parse Twilio's form-encoded webhook body.
+    Parse Twilio's form-encoded webhook body (starlette FormData or any mapping).
     Returns a dict with from, body, message_sid or None if not a message.
     """
     msg_body = form_data.get("Body", "").strip()
@@ -9,8 +9,12 @@ from __future__ import annotations
 
 import argparse
 import logging
+import re
 import sys
 import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -22,6 +26,29 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Lines starting with one of these (any case) open a new section.
+# Prefix match, like str.startswith — "PRODUCTS" matches PRODUCT.
+SECTION_RE = re.compile(
+    r"(?:COMPANY|PRODUCT|PRICING|DELIVERY|PAYMENT|QUALITY|HOW TO|CONTACT|FAQ"
+    r"|SIGNAGE|BRAND|EVENT|FLYER|POSTER|BANNER|STAMP|BROCHURE|ENVELOPE"
+    r"|FOLDER|MERCHANDISE|OVERVIEW|SECTION)",
+    re.IGNORECASE,
+)
+
+
+def _iter_docx_lines(doc) -> Iterator[str]:
+    """Yield non-empty paragraphs, then table rows as 'cell | cell'."""
+    strip = str.strip
+    for para in doc.paragraphs:
+        text = strip(para.text)
+        if text:
+            yield text
+    for table in doc.tables:
+        for row in table.rows:
+            cells = list(filter(None, (strip(c.text) for c in row.cells)))
+            if cells:
+                yield ' | '.join(cells)
+
 
 def read_source_file(path: Path) -> str:
     """Read .docx or .txt knowledge base file."""
@@ -32,39 +59,26 @@ def read_source_file(path: Path) -> str:
     else:
         from docx import Document
         doc = Document(str(path))
-        parts = []
-        for para in doc.paragraphs:
-            text = para.text.strip()
-            if text:
-                parts.append(text)
-        for table in doc.tables:
-            for row in table.rows:
-                cells = [c.text.strip() for c in row.cells if c.text.strip()]
-                if cells:
-                    parts.append(' | '.join(cells))
-        raw = '\n\n'.join(parts)
+        raw = '\n\n'.join(_iter_docx_lines(doc))
         logger.info(f"Extracted {len(raw):,} characters from {path.name}")
         return raw
 
 
-def chunk_text(text: str, chunk_size: int, overlap: int) -> list[dict]:
-    """Split text into overlapping chunks with section metadata."""
+@lru_cache(maxsize=8)
+def _get_splitter(chunk_size: int, overlap: int):
+    """One splitter per (chunk_size, overlap) — reused across /admin/ingest runs."""
     from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-    splitter = RecursiveCharacterTextSplitter(
+    return RecursiveCharacterTextSplitter(
         chunk_size    = chunk_size,
         chunk_overlap = overlap,
         separators    = ["\n\n", "\n", ". ", " ", ""],
     )
-    raw_chunks = splitter.split_text(text)
 
-    section_markers = [
-        "COMPANY", "PRODUCT", "PRICING", "DELIVERY", "PAYMENT",
-        "QUALITY", "HOW TO", "CONTACT", "FAQ", "SIGNAGE",
-        "BRAND", "EVENT", "FLYER", "POSTER", "BANNER", "STAMP",
-        "BROCHURE", "ENVELOPE", "FOLDER", "MERCHANDISE", "OVERVIEW",
-        "SECTION",
-    ]
+
+def chunk_text(text: str, chunk_size: int, overlap: int) -> list[dict]:
+    """Split text into overlapping chunks with section metadata."""
+    raw_chunks = _get_splitter(chunk_size, overlap).split_text(text)
 
     result: list[dict] = []
     current_section    = "General"
@@ -72,10 +86,9 @@ def chunk_text(text: str, chunk_size: int, overlap: int) -> list[dict]:
     for i, chunk in enumerate(raw_chunks):
         for line in chunk.split("\n"):
             line = line.strip()
-            if line and len(line) < 80:
-                if any(line.upper().startswith(kw) for kw in section_markers):
-                    current_section = line[:60]
-                    break
+            if line and len(line) < 80 and SECTION_RE.match(line):
+                current_section = line[:60]
+                break
         result.append({
             "content":      chunk,
             "section":      current_section,
@@ -92,7 +105,8 @@ def run_ingestion(docx_path: Path) -> int:
     Full pipeline:
       1. Read file
       2. Chunk
-      3. Embed with Gemini API
+      3. Embed (EMBEDDING_PROVIDER) — any failure aborts here, before
+         the existing documents are touched
       4. Clear old Supabase data
       5. Insert new chunks + embeddings
     Returns total chunks stored.
@@ -121,39 +135,49 @@ def run_ingestion(docx_path: Path) -> int:
     texts  = [c["content"] for c in chunks]
 
     # 3. Embed
-    logger.info(f"Embedding {len(texts)} chunks with Gemini API...")
+    logger.info(f"Embedding {len(texts)} chunks with {settings.embedding_provider}...")
     embeddings = embed_texts(texts)
     logger.info("Embeddings complete")
 
+    # The column is halfvec: cast to fp16 here so the values sent are exactly
+    # the ones Postgres stores
+    import numpy as np
+    embeddings = np.asarray(embeddings, dtype=np.float32).astype(np.float16).tolist()
+
     # 4. Clear old data
     logger.info("Clearing existing Supabase documents...")
     clear_documents()
 
-    # 5. Insert in batches of 50
-    BATCH          = 50
+    # 5. Insert in batches of 200, pipelined over a few threads so request
+    #    latency overlaps with building the next batch. 200 rows of 768-dim
+    #    vectors keep each request body well under PostgREST's size limit.
+    BATCH          = 200
+    WORKERS        = 4
     total_inserted = 0
 
-    for i in range(0, len(chunks), BATCH):
-        batch_chunks     = chunks[i : i + BATCH]
-        batch_embeddings = embeddings[i : i + BATCH]
-
-        rows = [
-            {
-                "content":   batch_chunks[j]["content"],
-                "metadata":  {
-                    "section":      batch_chunks[j]["section"],
-                    "chunk_index":  batch_chunks[j]["chunk_index"],
-                    "total_chunks": batch_chunks[j]["total_chunks"],
-                    "source":       docx_path.name,
-                },
-                "embedding": batch_embeddings[j],
-            }
-            for j in range(len(batch_chunks))
-        ]
-
-        insert_document_chunks(rows)
-        total_inserted += len(rows)
-        logger.info(f"  Stored {total_inserted}/{len(chunks)}")
+    with ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="ingest") as pool:
+        source  = docx_path.name
+        pending = {}
+        for i in range(0, len(chunks), BATCH):
+            rows = [
+                {
+                    "content":   c["content"],
+                    "metadata":  {
+                        "section":      c["section"],
+                        "chunk_index":  c["chunk_index"],
+                        "total_chunks": c["total_chunks"],
+                        "source":       source,
+                    },
+                    "embedding": e,
+                }
+                for c, e in zip(chunks[i : i + BATCH], embeddings[i : i + BATCH])
+            ]
+            pending[pool.submit(insert_document_chunks, rows)] = len(rows)
+
+        for future in as_completed(pending):
+            future.result()
+            total_inserted += pending[future]
+            logger.info(f"  Stored {total_inserted}/{len(chunks)}")
 
     logger.info(f"Ingestion complete — {total_inserted} chunks in Supabase")
     return total_inserted
@@ -179,7 +203,7 @@ def main():
     print("═" * 62)
     print(f"  Source  : {docx_path.resolve()}")
     print(f"  Supabase: {settings.supabase_url}")
-    print(f"  Model   : Gemini text-embedding-004 (768-dim)")
+    print(f"  Model   : {settings.embedding_provider} ({settings.embedding_dim}-dim)")
     print(f"  Chunks  : size={settings.chunk_size}, overlap={settings.chunk_overlap}")
     print("═" * 62)
     print()
@@ -0,0 +1,34 @@
+-- save_turn — persist one conversation turn in a single round-trip / transaction:
+-- the user message, the bot reply, and the session upsert.
+create or replace function save_turn(
+    p_session_id    text,
+    p_phone_number  text,
+    p_user_message  text,
+    p_bot_message   text,
+    p_language      text,
+    p_user_metadata jsonb,
+    p_bot_metadata  jsonb,
+    p_state         jsonb
+)
+returns void
+language plpgsql
+as $$
+begin
+    -- clock_timestamp() (not now()) keeps user → assistant ordering by created_at
+    insert into colorix_conversations (session_id, role, content, language, metadata, created_at)
+    values (p_session_id, 'user', p_user_message, p_language,
+            coalesce(p_user_metadata, '{}'::jsonb), clock_timestamp());
+
+    insert into colorix_conversations (session_id, role, content, language, metadata, created_at)
+    values (p_session_id, 'assistant', p_bot_message, p_language,
+            coalesce(p_bot_metadata, '{}'::jsonb), clock_timestamp());
+
+    insert into colorix_sessions (session_id, phone_number, language, state, last_active)
+    values (p_session_id, p_phone_number, p_language, coalesce(p_state, '{}'::jsonb), now())
+    on conflict (session_id) do update
+        set phone_number = excluded.phone_number,
+            language     = excluded.language,
+            state        = excluded.state,
+            last_active  = excluded.last_active;
+end;
+$$;
@@ -0,0 +1,31 @@
+-- match_colorix_documents — inner-product search over unit-norm embeddings.
+-- app/embeddings.py L2-normalizes every vector it returns (documents and queries),
+-- so cosine similarity == inner product and pgvector can skip the norm computation.
+-- `<#>` returns the NEGATIVE inner product, hence the sign flips below.
+
+-- Rows written before normalization was enforced (requires pgvector >= 0.7)
+update colorix_documents set embedding = l2_normalize(embedding);
+
+drop function if exists match_colorix_documents(vector, float, int);
+
+create function match_colorix_documents(
+    query_embedding vector(768),
+    match_threshold float,
+    match_count     int
+)
+returns table (id bigint, content text, metadata jsonb, similarity float)
+language sql stable
+as $$
+    select id,
+           content,
+           metadata,
+           -(embedding <#> query_embedding) as similarity
+    from colorix_documents
+    where -(embedding <#> query_embedding) > match_threshold
+    order by embedding <#> query_embedding
+    limit match_count;
+$$;
+
+drop index if exists colorix_documents_embedding_idx;
+create index colorix_documents_embedding_idx
+    on colorix_documents using hnsw (embedding vector_ip_ops);
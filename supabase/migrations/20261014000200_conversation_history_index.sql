@@ -0,0 +1,7 @@
+-- get_conversation_history: latest N messages of a session.
+-- Matches `where session_id = ? order by created_at desc limit N`, so the read
+-- is an index range scan that stops after N rows instead of a sort.
+-- (content is deliberately not INCLUDEd — long messages would exceed the
+-- btree row size limit.)
+create index if not exists colorix_conversations_session_created_idx
+    on colorix_conversations (session_id, created_at desc);
@@ -0,0 +1,32 @@
+-- Store document embeddings as halfvec (fp16, pgvector >= 0.7): half the table
+-- and HNSW index size, so the memory-bound index scan touches half the bytes.
+-- Recall loss is negligible for unit-norm 768-dim vectors.
+-- The RPC keeps a vector(768) parameter so callers are unchanged.
+
+drop index if exists colorix_documents_embedding_idx;
+
+alter table colorix_documents
+    alter column embedding type halfvec(768) using embedding::halfvec(768);
+
+drop function if exists match_colorix_documents(vector, float, int);
+
+create function match_colorix_documents(
+    query_embedding vector(768),
+    match_threshold float,
+    match_count     int
+)
+returns table (id bigint, content text, metadata jsonb, similarity float)
+language sql stable
+as $$
+    select id,
+           content,
+           metadata,
+           -(embedding <#> query_embedding::halfvec(768)) as similarity
+    from colorix_documents
+    where -(embedding <#> query_embedding::halfvec(768)) > match_threshold
+    order by embedding <#> query_embedding::halfvec(768)
+    limit match_count;
+$$;
+
+create index colorix_documents_embedding_idx
+    on colorix_documents using hnsw (embedding halfvec_ip_ops);